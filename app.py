@@ -2,13 +2,22 @@ from decimal import Decimal
 import os
 import streamlit as st
 import asyncio
-import json
 from datetime import datetime
 import traceback
-import time
 
-from interactive_session import SessionManager, ConversationMessage, CounselorState
+from openai import AsyncOpenAI
+from pydantic_core import to_json
+
+from interactive_session import (
+    EVENT_LOOP_FACTORY,
+    SessionManager,
+    ConversationMessage,
+    CounselorState,
+)
+from llm_agent.base import warm_up_llm_client
+from llm_agent.flow_control import FlowControlContext
 from models import BackgroundContext
+from settings import settings
 
 
 def _get_current_state_round_fixed(self) -> int:
@@ -29,8 +38,6 @@ def _get_current_state_round_fixed(self) -> int:
 
 
 async def execute_flow_control_and_update(self):
-    from llm_agent.flow_control import FlowControlContext
-
     current_state_round = self._get_current_state_round()
     flow_context = FlowControlContext(
         conversation_history=self.conversation_history,
@@ -48,9 +55,7 @@ async def execute_flow_control_and_update(self):
     self.flow_control_results.append(
         {"round": self.current_round, "flow_result": flow_result.model_dump()}
     )
-    await self.flow_control_agent.update_student_bot_state(
-        self.student_bot, flow_result
-    )
+    self.flow_control_agent.update_student_bot_state(self.student_bot, flow_result)
     return flow_result
 
 
@@ -84,8 +89,9 @@ async def export_session_data_fixed(self, save_to_file=True):
             "end_time": datetime.now().isoformat(),
             "total_rounds": self.current_round,
         },
-        "background_info": self.background.model_dump() if self.background else None,
-        "conversation_history": [msg.model_dump() for msg in self.conversation_history],
+        # 模型对象在导出时直接由 pydantic-core 序列化，会话结束时无需逐条转换
+        "background_info": self.background,
+        "conversation_history": list(self.conversation_history),
         "flow_control_results": self.flow_control_results,
         "state_transition_history": self.state_transition_history,
         "student_state_history": self.student_state_history,
@@ -102,13 +108,11 @@ async def export_session_data_fixed(self, save_to_file=True):
         "usages": self.usage_summary,
     }
     if save_to_file:
-        import os
-
         export_dir = "exports"
         os.makedirs(export_dir, exist_ok=True)
         filename = f"{export_dir}/session_{self.session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(session_data, f, indent=2, ensure_ascii=False)
+        with open(filename, "wb") as f:
+            f.write(to_json(session_data, indent=2))
         print(f"会话数据已导出到: {filename}")
     return session_data
 
@@ -126,17 +130,47 @@ if not hasattr(SessionManager, "_monkey_patched"):
 
 
 def run_async(awaitable):
-    return asyncio.run(awaitable)
+    """
+    在当前浏览器会话持久的事件循环上运行协程
+    asyncio.run 每次都会新建并关闭事件循环，各Bot的 HTTP 连接池无法跨次点击复用；
+    复用同一个 Runner 可以保持长连接，省去每轮重新建立 TCP/TLS 连接的开销
+    """
+    if "async_runner" not in st.session_state:
+        st.session_state.async_runner = asyncio.Runner(loop_factory=EVENT_LOOP_FACTORY)
+    return st.session_state.async_runner.run(awaitable)
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """当前浏览器会话的LLM客户端，与 run_async 的事件循环配套使用"""
+    if "llm_client" not in st.session_state:
+        st.session_state.llm_client = AsyncOpenAI(
+            api_key=settings.LLM_API_KEY, base_url=settings.LLM_API_BASE_URL
+        )
+    return st.session_state.llm_client
 
 
 def get_role_and_avatar(role: str):
     return ("🎓", "student") if role == "student" else ("👨‍⚕️", "assistant")
 
 
+async def stream_reply(chunks, role: str) -> str:
+    """将流式回复逐段渲染到对话气泡中，返回完整回复"""
+    avatar, role_name = get_role_and_avatar(role)
+    with st.chat_message(name=role_name, avatar=avatar):
+        placeholder = st.empty()
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            placeholder.markdown("".join(parts))
+    return "".join(parts).strip()
+
+
 def render_sidebar():
     with st.sidebar:
         st.header("会话状态监控")
         if st.button("🔄 开始新会话"):
+            if "async_runner" in st.session_state:
+                st.session_state.async_runner.close()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
@@ -239,24 +273,30 @@ def render_end_of_session_summary():
         st.markdown(usage_summary(session_data.get("usages", [])))
         st.json(session_data.get("usages", []), expanded=False)
 
-        # 直接保存到服务器 exports 目录
-        export_dir = "exports"
-        os.makedirs(export_dir, exist_ok=True)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{export_dir}/session_streamlit_{session_data['session_info']['session_id']}_{timestamp}.json"
+        # 会话数据只序列化一次，页面每次重新运行时复用，并且只保存一次到服务器 exports 目录
+        if "session_data_json" not in st.session_state:
+            session_data_json = to_json(session_data, indent=2)
+            st.session_state.session_data_json = session_data_json
+
+            export_dir = "exports"
+            os.makedirs(export_dir, exist_ok=True)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"{export_dir}/session_streamlit_{session_data['session_info']['session_id']}_{timestamp}.json"
 
-        try:
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(session_data, f, indent=2, ensure_ascii=False)
-            print(f"✅ 会话数据已导出到: {filename}")
-        except Exception as e:
-            print(f"❌ 导出失败: {str(e)}")
+            try:
+                with open(filename, "wb") as f:
+                    f.write(session_data_json)
+                print(f"✅ 会话数据已导出到: {filename}")
+            except Exception as e:
+                print(f"❌ 导出失败: {str(e)}")
 
         st.download_button(
             label="📥 下载完整会话数据 (JSON)",
-            data=json.dumps(session_data, indent=2, ensure_ascii=False),
+            data=st.session_state.session_data_json,
             file_name=f"session_{session_data['session_info']['session_id']}.json",
             mime="application/json",
+            # 下载只在浏览器端进行，不需要重新运行整个页面
+            on_click="ignore",
         )
 
 
@@ -266,7 +306,10 @@ def run_one_round():
     try:
         # --- 咨询师回复 ---
         counselor_response = run_async(
-            manager.counselor_bot.chat(manager.conversation_history)
+            stream_reply(
+                manager.counselor_bot.chat_stream(manager.conversation_history),
+                "counselor",
+            )
         )
         counselor_msg = ConversationMessage(
             role="counselor",
@@ -275,13 +318,7 @@ def run_one_round():
             round_number=manager.current_round,
         )
         manager.conversation_history.append(counselor_msg)
-        manager.counselor_state_history.append(
-            {
-                "round": manager.current_round,
-                "state": manager.counselor_bot.current_state.value,
-                "message": counselor_response,
-            }
-        )
+        manager.record_counselor_state(counselor_response)
 
         # --- 流程控制与状态更新 ---
         flow_result = run_async(manager.execute_flow_control_and_update())
@@ -301,7 +338,10 @@ def run_one_round():
         else:
             # --- 学生为下一轮做准备 ---
             student_response = run_async(
-                manager.student_bot.chat(manager.conversation_history)
+                stream_reply(
+                    manager.student_bot.chat_stream(manager.conversation_history),
+                    "student",
+                )
             )
             student_msg = ConversationMessage(
                 role="student",
@@ -364,7 +404,9 @@ def main():
         if st.button("🚀 开始会话", type="primary"):
             with st.spinner("正在初始化会话，生成背景信息..."):
                 try:
-                    manager = SessionManager(auto_mode=True)
+                    manager = SessionManager(
+                        auto_mode=True, llm_client=get_llm_client()
+                    )
                     background = BackgroundContext(mode="random")
                     if background_mode == "guided":
                         background = BackgroundContext(
@@ -391,6 +433,11 @@ def main():
                     st.error(f"初始化失败: {e}")
                     st.error(traceback.format_exc())
 
+        # 表单已经渲染完毕，在用户填写配置期间预热LLM连接，首次生成背景时无需再建立连接
+        if "llm_warmed_up" not in st.session_state:
+            st.session_state.llm_warmed_up = True
+            run_async(warm_up_llm_client(get_llm_client()))
+
     # --- 阶段 4: 对话结束 ---
     elif st.session_state.get("dialogue_finished", False):
         render_conversation_history()
@@ -418,9 +465,7 @@ def main():
         )
         # 自动运行一轮
         run_one_round()
-        # 等待2秒，方便用户观看
-        time.sleep(2)
-        # 强制页面刷新以进入下一轮循环
+        # 回复已在生成时流式显示，无需等待，直接强制页面刷新以进入下一轮循环
         st.rerun()
 
 
@@ -3,6 +3,8 @@
 用于提供Few-shot examples和参考框架
 """
 
+from types import MappingProxyType
+
 from models import PsychologicalIssue, TherapyApproach, CounselorState, EmotionState
 
 
@@ -241,6 +243,8 @@ PSYCHOLOGICAL_ISSUES_DATA = {
         ],
     },
 }
+# 只读视图，防止运行期被意外修改
+PSYCHOLOGICAL_ISSUES_DATA = MappingProxyType(PSYCHOLOGICAL_ISSUES_DATA)
 
 
 # ==================== 咨询流派数据库 ====================
@@ -383,6 +387,8 @@ THERAPY_APPROACHES_DATA = {
         ],
     },
 }
+# 只读视图，防止运行期被意外修改
+THERAPY_APPROACHES_DATA = MappingProxyType(THERAPY_APPROACHES_DATA)
 
 
 # ==================== 状态转换参考信息 ====================
@@ -12,9 +12,10 @@ import uuid
 from datetime import datetime
 import os
 
-from traceloop.sdk import Traceloop
-from traceloop.sdk.decorators import workflow, task
+from openai import AsyncOpenAI
 from openai.types import CompletionUsage
+from pydantic import TypeAdapter
+from pydantic_core import to_json
 
 from llm_agent.quality_assess import QualityAssessmentAgent, QualityAssessmentContext
 from models import (
@@ -27,9 +28,18 @@ from llm_agent.background_gen import BackgroundGenerationAgent
 from llm_agent.student import StudentBot
 from llm_agent.counselor import CounselorBot
 from llm_agent.flow_control import FlowControlAgent, FlowControlContext
+from llm_agent.tracing import init_tracing, task, workflow
 from settings import settings
 
-Traceloop.init(api_key=settings.TRACELOOP_API_KEY, disable_batch=True)
+init_tracing()
+
+# 安装了 uvloop 时使用基于 libuv 的事件循环，否则使用 asyncio 默认事件循环
+try:
+    import uvloop
+
+    EVENT_LOOP_FACTORY = uvloop.new_event_loop
+except ImportError:
+    EVENT_LOOP_FACTORY = None
 
 
 class Colors:
@@ -126,17 +136,26 @@ def get_user_confirmation(prompt: str = "是否继续下一轮对话？") -> boo
             sys.exit(0)
 
 
+def write_json_file(filename: str, data: Any) -> None:
+    """序列化数据并写入 JSON 文件"""
+    with open(filename, "wb") as f:
+        f.write(to_json(data, indent=2))
+
+
 class SessionManager:
     """
     管理整个聊天流程的会话管理器
     """
 
-    def __init__(self, auto_mode: bool = False):
+    def __init__(
+        self, auto_mode: bool = False, llm_client: Optional[AsyncOpenAI] = None
+    ):
         """
         初始化会话管理器，创建背景并保留
 
         Args:
             auto_mode: 是否开启自动模式，自动模式下会连续运行直到达到终止条件
+            llm_client: 已创建（可能已预热）的LLM客户端，为空时创建新的客户端
         """
         mode_prefix = "auto" if auto_mode else "interactive"
         self.session_id = f"{mode_prefix}_{uuid.uuid4().hex[:8]}"
@@ -152,9 +171,16 @@ class SessionManager:
         self.state_transition_history: List[Dict[str, Any]] = []
         self.student_state_history: List[Dict[str, Any]] = []
         self.counselor_state_history: List[Dict[str, Any]] = []
+        # 各咨询师状态已记录的轮数，随状态记录增量更新
+        self.counselor_state_rounds: Counter = Counter()
         self.session_start_time = datetime.now()
 
-        self.background_agent = BackgroundGenerationAgent()
+        # 会话内的所有Agent共享同一个LLM客户端（同一个事件循环中使用），
+        # 复用连接池，避免每个Agent各自创建客户端和建立连接
+        self.llm_client = llm_client or AsyncOpenAI(
+            api_key=settings.LLM_API_KEY, base_url=settings.LLM_API_BASE_URL
+        )
+        self.background_agent = BackgroundGenerationAgent(llm_client=self.llm_client)
         self.student_bot: StudentBot = None
         self.counselor_bot: CounselorBot = None
         self.flow_control_agent: FlowControlAgent = None
@@ -176,21 +202,19 @@ class SessionManager:
             self.initial_question = background_result.initial_question
             self.usages.append(self.background_agent.usage)
             print_colored("✅ 背景信息生成成功！", Colors.OKGREEN)
-            print_colored(
-                json.dumps(self.background.model_dump(), indent=2, ensure_ascii=False)
-            )
+            print_colored(self.background.model_dump_json(indent=2))
         except Exception as e:
             print_colored(f"❌ 背景生成失败: {str(e)}", Colors.FAIL)
             raise e
 
         # 初始化 Agents
-        self.student_bot = StudentBot()
+        self.student_bot = StudentBot(self.llm_client)
         self.student_bot.update_background(self.background.student_info)
-        self.counselor_bot = CounselorBot()
+        self.counselor_bot = CounselorBot(self.llm_client)
         self.counselor_bot.update_background(
             self.background.counselor_info, self.background.student_info
         )
-        self.flow_control_agent = FlowControlAgent()
+        self.flow_control_agent = FlowControlAgent(llm_client=self.llm_client)
 
     def get_auto_mode_confirmation(
         self, prompt: str = "背景信息已生成，是否开始对话？"
@@ -232,12 +256,22 @@ class SessionManager:
         """
         if not self.conversation_history:
             return 1
-        current_state = self.counselor_bot.current_state
-        return sum(
-            1
-            for state_record in self.counselor_state_history
-            if state_record.get("state") == current_state
+        return self.counselor_state_rounds[self.counselor_bot.current_state.value]
+
+    def record_counselor_state(self, counselor_response: str):
+        """
+        记录本轮咨询师状态，并更新各状态的轮数计数
+        """
+        state = self.counselor_bot.current_state.value
+        self.counselor_state_history.append(
+            {
+                "round": self.current_round,
+                "timestamp": datetime.now().isoformat(),
+                "state": state,
+                "message": counselor_response,
+            }
         )
+        self.counselor_state_rounds[state] += 1
 
     @task(name="conversation_loop", version=1)
     async def run(self):
@@ -317,14 +351,7 @@ class SessionManager:
             print_message(counselor_msg, is_new=True)
 
             # 记录咨询师状态
-            self.counselor_state_history.append(
-                {
-                    "round": self.current_round,
-                    "timestamp": datetime.now().isoformat(),
-                    "state": self.counselor_bot.current_state.value,
-                    "message": counselor_response,
-                }
-            )
+            self.record_counselor_state(counselor_response)
 
             # 流程控制
             print_colored("正在进行流程控制评估...", Colors.OKCYAN)
@@ -342,34 +369,29 @@ class SessionManager:
             flow_result = await self.flow_control_agent.execute(flow_context)
             self.usages.append(self.flow_control_agent.usage)
 
-            # 记录流程控制结果
+            # 记录流程控制结果，更新前的学生状态同时用于下方打印
+            pre_student_state = self.student_bot.get_student_state()
             self.flow_control_results.append(
                 {
                     "round": self.current_round,
                     "timestamp": datetime.now().isoformat(),
                     "flow_result": flow_result.model_dump(),
-                    "pre_student_state": self.student_bot.get_student_state(),
+                    "pre_student_state": pre_student_state,
                 }
             )
 
             print_colored("-" * 80, Colors.OKCYAN)
             print_colored("流程控制评估完成，状态评估结果: ", Colors.OKGREEN)
-            print_colored(
-                json.dumps(flow_result.model_dump(), indent=2, ensure_ascii=False)
-            )
+            print_colored(flow_result.model_dump_json(indent=2))
             print_colored(
                 f"当前咨询师状态: {self.counselor_bot.current_state}", Colors.OKGREEN
             )
             print_colored("当前学生状态: ", Colors.OKGREEN)
-            print(
-                json.dumps(
-                    self.student_bot.get_student_state(), indent=2, ensure_ascii=False
-                )
-            )
+            print(json.dumps(pre_student_state, indent=2, ensure_ascii=False))
             print_colored("-" * 80, Colors.OKCYAN)
 
             # 更新学生状态
-            await self.flow_control_agent.update_student_bot_state(
+            self.flow_control_agent.update_student_bot_state(
                 self.student_bot, flow_result
             )
 
@@ -494,13 +516,10 @@ class SessionManager:
                 "end_time": datetime.now().isoformat(),
                 "total_rounds": self.current_round,
             },
-            "background_info": self.background.model_dump()
-            if self.background
-            else None,
+            # 模型对象直接交给 pydantic-core 序列化，无需先逐个转换为字典
+            "background_info": self.background,
             "initial_question": self.initial_question,
-            "conversation_history": [
-                msg.model_dump() for msg in self.conversation_history
-            ],
+            "conversation_history": self.conversation_history,
             "flow_control_results": self.flow_control_results,
             "state_transition_history": self.state_transition_history,
             "student_state_history": self.student_state_history,
@@ -526,8 +545,9 @@ class SessionManager:
         filename = f"{export_dir}/session_{self.session_id}_{timestamp}.json"
 
         try:
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(session_data, f, indent=2, ensure_ascii=False)
+            # 放到线程中执行，批量模式下文件写入期间其他会话可以继续；
+            # to_json 序列化期间持有 GIL，仍会短暂阻塞事件循环
+            await asyncio.to_thread(write_json_file, filename, session_data)
             print_colored(f"✅ 会话数据已导出到: {filename}", Colors.OKGREEN)
         except Exception as e:
             print_colored(f"❌ 导出失败: {str(e)}", Colors.FAIL)
@@ -552,16 +572,47 @@ class SessionManager:
             conversation_history=self.conversation_history,
             counseling_trajectory=counseling_trajectory,
         )
-        quality_assessment_agent = QualityAssessmentAgent()
+        quality_assessment_agent = QualityAssessmentAgent(llm_client=self.llm_client)
         assessment_result = await quality_assessment_agent.execute(quality_context)
         self.usages.append(quality_assessment_agent.usage)
         print_colored("质量评估结果:", Colors.OKGREEN)
-        print_colored(
-            json.dumps(assessment_result.model_dump(), indent=2, ensure_ascii=False)
-        )
+        print_colored(assessment_result.model_dump_json(indent=2))
         return assessment_result.model_dump()
 
 
+async def run_batch(
+    count: int, max_rounds: int = 20, concurrency: Optional[int] = None
+) -> List[Any]:
+    """
+    并发运行多个自动模式会话，用于批量生成对话数据
+    各会话相互独立，每个会话结束时各自导出数据文件
+
+    Args:
+        count: 会话数量
+        max_rounds: 每个会话的最大轮次
+        concurrency: 最大并发会话数，为空时使用 settings.LLM_BATCH_CONCURRENCY
+
+    Returns:
+        List: 与输入顺序一致的结果，成功为 SessionManager，失败为对应的异常
+    """
+    if concurrency is None:
+        concurrency = settings.LLM_BATCH_CONCURRENCY
+    if concurrency < 1:
+        raise ValueError(f"concurrency 必须大于等于 1，当前为 {concurrency}")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one() -> SessionManager:
+        async with semaphore:
+            manager = SessionManager(auto_mode=True)
+            manager.max_rounds = max_rounds
+            await manager.run()
+            return manager
+
+    return await asyncio.gather(
+        *(run_one() for _ in range(count)), return_exceptions=True
+    )
+
+
 @workflow(name="心理咨询对话生成器", version=1)
 async def main():
     """
@@ -579,8 +630,39 @@ async def main():
     parser.add_argument(
         "--max-rounds", type=int, default=20, help="自动模式下的最大轮次数（默认：20）"
     )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=0,
+        help="批量模式：以自动模式并发生成指定数量的会话",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="批量模式下的最大并发会话数（默认：LLM_BATCH_CONCURRENCY）",
+    )
 
     args = parser.parse_args()
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency 必须大于等于 1")
+
+    if args.batch:
+        results = await run_batch(args.batch, args.max_rounds, args.concurrency)
+        managers = [r for r in results if isinstance(r, SessionManager)]
+        for error in results:
+            if not isinstance(error, SessionManager):
+                print_colored(f"❌ 会话失败: {error}", Colors.FAIL)
+        print_colored(
+            f"批量生成完成：成功 {len(managers)} 个，失败 {len(results) - len(managers)} 个",
+            Colors.OKGREEN,
+        )
+        usages = [usage for manager in managers for usage in manager.usages]
+        print_colored(
+            f"总计 tokens: {sum(usage.total_tokens for usage in usages)}",
+            Colors.OKGREEN,
+        )
+        return
 
     manager = SessionManager(auto_mode=args.auto)
     if args.auto:
@@ -589,12 +671,14 @@ async def main():
 
     await manager.run()
     print_colored("会话已结束，成本信息如下：", Colors.OKGREEN)
-    print(json.dumps(manager.usages, indent=2, ensure_ascii=False))
+    print(
+        TypeAdapter(List[CompletionUsage]).dump_json(manager.usages, indent=2).decode()
+    )
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(), loop_factory=EVENT_LOOP_FACTORY)
     except KeyboardInterrupt:
         print_colored("\n\n用户中断程序", Colors.FAIL)
         sys.exit(0)
@@ -6,7 +6,7 @@
 import random
 from typing import Any
 
-from traceloop.sdk.decorators import agent
+from .tracing import agent
 
 from .base import Agent
 from constants import (
@@ -4,22 +4,45 @@
 以及Chat History转换工具函数
 """
 
-import json
-from typing import Dict, Generic, List, Any, Type, TypeVar, Union
+import re
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from datetime import datetime
 
 from openai import AsyncOpenAI
-from pydantic import BaseModel
-from opentelemetry import trace
+from openai.types import CompletionUsage
+from openai.types.shared_params import ResponseFormatJSONSchema
+from pydantic import BaseModel, ValidationError
+from pydantic_core import from_json, to_json
 
 from models import ConversationMessage, CounselorState, EmotionState, RiskAssessment
 from settings import settings
+from .cache import get_response_cache, hash_prompt
+from .tracing import current_span
 
 # 为 Agent 定义泛型类型变量
 TContext = TypeVar("TContext")
 TResult = TypeVar("TResult", bound=BaseModel)
 
 
+# 对话角色 -> 各Bot视角下的LLM消息角色
+# 学生Bot视角：学生的消息作为assistant，咨询师的消息作为user
+STUDENT_VIEW_ROLES = {"student": "assistant", "counselor": "user"}
+# 咨询师Bot视角：咨询师的消息作为assistant，学生的消息作为user
+COUNSELOR_VIEW_ROLES = {"counselor": "assistant", "student": "user"}
+
+
 def convert_history_for_student(
     conversation_history: List[ConversationMessage],
 ) -> List[Dict[str, str]]:
@@ -33,17 +56,11 @@ def convert_history_for_student(
     Returns:
         List[Dict]: 适用于学生Bot的消息格式
     """
-    converted_history = []
-
-    for msg in conversation_history:
-        if msg.role == "student":
-            # 学生的消息作为assistant
-            converted_history.append({"role": "assistant", "content": msg.content})
-        elif msg.role == "counselor":
-            # 咨询师的消息作为user
-            converted_history.append({"role": "user", "content": msg.content})
-
-    return converted_history
+    return [
+        {"role": STUDENT_VIEW_ROLES[msg.role], "content": msg.content}
+        for msg in conversation_history
+        if msg.role in STUDENT_VIEW_ROLES
+    ]
 
 
 def convert_history_for_counselor(
@@ -59,17 +76,11 @@ def convert_history_for_counselor(
     Returns:
         List[Dict]: 适用于咨询师Bot的消息格式
     """
-    converted_history = []
-
-    for msg in conversation_history:
-        if msg.role == "counselor":
-            # 咨询师的消息作为assistant
-            converted_history.append({"role": "assistant", "content": msg.content})
-        elif msg.role == "student":
-            # 学生的消息作为user
-            converted_history.append({"role": "user", "content": msg.content})
-
-    return converted_history
+    return [
+        {"role": COUNSELOR_VIEW_ROLES[msg.role], "content": msg.content}
+        for msg in conversation_history
+        if msg.role in COUNSELOR_VIEW_ROLES
+    ]
 
 
 def get_last_n_messages(
@@ -92,6 +103,121 @@ def get_last_n_messages(
     )
 
 
+async def warm_up_llm_client(llm_client: AsyncOpenAI, timeout: float = 5.0) -> None:
+    """
+    预热LLM客户端：请求一次模型列表，提前完成 DNS 解析和 TCP/TLS 握手，
+    之后的对话请求可以直接复用连接池中的连接
+    预热失败（超时、服务商不支持该接口等）不影响后续使用，直接忽略
+
+    Args:
+        llm_client: 需要预热的LLM客户端
+        timeout: 预热请求的超时时间（秒）
+    """
+    try:
+        # with_options 返回的副本与原客户端共享同一个 HTTP 连接池
+        await llm_client.with_options(timeout=timeout, max_retries=0).models.list()
+    except Exception:
+        pass
+
+
+def _strict_json_schema(schema: Dict[str, Any], root: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将 JSON Schema 原地转换为 strict 结构化输出要求的形式：
+    对象禁止额外字段且所有属性必填，去掉为 None 的默认值，
+    带有其他键的 $ref 展开为引用的定义
+    """
+    for definitions in (schema.get("$defs"), schema.get("definitions")):
+        if isinstance(definitions, dict):
+            for definition in definitions.values():
+                _strict_json_schema(definition, root)
+
+    if schema.get("type") == "object" and "additionalProperties" not in schema:
+        schema["additionalProperties"] = False
+
+    properties = schema.get("properties")
+    if isinstance(properties, dict):
+        schema["required"] = list(properties)
+        schema["properties"] = {
+            key: _strict_json_schema(value, root) for key, value in properties.items()
+        }
+
+    items = schema.get("items")
+    if isinstance(items, dict):
+        schema["items"] = _strict_json_schema(items, root)
+
+    any_of = schema.get("anyOf")
+    if isinstance(any_of, list):
+        schema["anyOf"] = [_strict_json_schema(variant, root) for variant in any_of]
+
+    all_of = schema.get("allOf")
+    if isinstance(all_of, list):
+        if len(all_of) == 1:
+            schema.update(_strict_json_schema(all_of[0], root))
+            schema.pop("allOf")
+        else:
+            schema["allOf"] = [_strict_json_schema(entry, root) for entry in all_of]
+
+    if "default" in schema and schema["default"] is None:
+        schema.pop("default")
+
+    ref = schema.get("$ref")
+    if ref and len(schema) > 1:
+        resolved = root
+        for key in ref.removeprefix("#/").split("/"):
+            resolved = resolved[key]
+        # schema 自身的键优先于引用定义中的键
+        schema.update({**resolved, **schema})
+        schema.pop("$ref")
+        return _strict_json_schema(schema, root)
+
+    return schema
+
+
+@lru_cache(maxsize=None)
+def response_format_for(result_class: Type[BaseModel]) -> ResponseFormatJSONSchema:
+    """
+    生成并缓存结构化输出所需的 response_format 参数
+    JSON Schema 只需为每个结果类生成一次；以字典形式传给SDK时，
+    SDK 也不会再对返回内容做一次重复解析（由 Agent 自行解析）
+
+    Args:
+        result_class: 结果模型类
+
+    Returns:
+        ResponseFormatJSONSchema: response_format 参数
+    """
+    schema = result_class.model_json_schema()
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "schema": _strict_json_schema(schema, schema),
+            "name": result_class.__name__,
+            "strict": True,
+        },
+    }
+
+
+def _cached_reply(owner: Any, cache_key: Optional[str]) -> Optional[str]:
+    """
+    查询 ChatBot/Agent 的响应缓存，命中时将本次 usage 记为 0
+
+    Args:
+        owner: ChatBot 或 Agent 实例，缓存按其类名区分
+        cache_key: 缓存键，未启用缓存时为 None
+
+    Returns:
+        Optional[str]: 命中时返回缓存的响应内容，否则返回 None
+    """
+    if not cache_key:
+        return None
+    cached = get_response_cache(type(owner).__name__).get(cache_key)
+    if cached is not None:
+        owner.usage = CompletionUsage(
+            prompt_tokens=0, completion_tokens=0, total_tokens=0
+        )
+    return cached
+
+
 class ChatBot:
     """
     ChatBot基类
@@ -104,13 +230,25 @@ class ChatBot:
     temperature: float = settings.DEFAULT_TEMPERATURE
     max_tokens: int = settings.DEFAULT_MAX_TOKENS
 
-    def __init__(self):
+    # 是否按请求消息哈希缓存回复，完全相同的上下文直接返回缓存，不再请求LLM
+    cache_responses: bool = False
+
+    def __init__(
+        self, llm_client: Optional[AsyncOpenAI] = None, cache: Optional[bool] = None
+    ):
         """
         初始化ChatBot
+
+        Args:
+            llm_client: 共享的LLM客户端，为空时创建新的客户端
+            cache: 是否启用回复缓存，为空时使用类上的 cache_responses 默认值
         """
         self.current_round = 0
-        self.llm_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.llm_client = llm_client or AsyncOpenAI(
+            api_key=self.api_key, base_url=self.base_url
+        )
         self.usage = None
+        self.cache = self.cache_responses if cache is None else cache
 
     def convert_history_to_messages(
         self, conversation_history: List[ConversationMessage]
@@ -136,6 +274,78 @@ class ChatBot:
         """
         raise NotImplementedError("Subclasses must implement system_prompt property")
 
+    def split_system_prompt(self) -> Tuple[Optional[str], str]:
+        """
+        拆分系统提示词为静态前缀和动态部分
+        子类可以重写此方法，返回整个会话内不变的前缀，默认没有静态前缀
+
+        Returns:
+            Tuple[Optional[str], str]: (静态前缀, 动态部分)
+        """
+        return None, self.system_prompt
+
+    def build_system_message(self) -> Dict[str, Any]:
+        """
+        构建 system 消息
+        开启 LLM_PROMPT_CACHE_CONTROL 且存在静态前缀时，拆分为两段内容并为静态段标注 cache_control，
+        否则发送拼接后的完整字符串（OpenAI 等服务商会自动缓存相同前缀）
+        """
+        if not settings.LLM_PROMPT_CACHE_CONTROL:
+            return {"role": "system", "content": self.system_prompt}
+
+        static_prompt, dynamic_prompt = self.split_system_prompt()
+        if not static_prompt:
+            return {"role": "system", "content": dynamic_prompt}
+        return {
+            "role": "system",
+            "content": [
+                {
+                    "type": "text",
+                    "text": static_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                },
+                {"type": "text", "text": dynamic_prompt},
+            ],
+        }
+
+    def build_messages(
+        self, history: List[ConversationMessage]
+    ) -> List[Dict[str, Any]]:
+        """
+        构建完整的消息列表
+        开启 LLM_STABLE_PROMPT_PREFIX 且存在静态前缀时，静态前缀作为首条 system 消息，
+        动态部分作为最后一条 system 消息放在对话历史之后。这样每轮请求只在末尾追加内容，
+        “静态前缀 + 对话历史”可以命中服务商的前缀缓存，不必每轮重新预填充整段历史
+
+        Args:
+            history: 完整的对话历史
+
+        Returns:
+            List[Dict]: LLM API格式的消息列表
+        """
+        history_messages = self.convert_history_to_messages(history)
+        if not settings.LLM_STABLE_PROMPT_PREFIX:
+            return [self.build_system_message()] + history_messages
+
+        static_prompt, dynamic_prompt = self.split_system_prompt()
+        if not static_prompt:
+            return [self.build_system_message()] + history_messages
+
+        static_content = static_prompt
+        if settings.LLM_PROMPT_CACHE_CONTROL:
+            static_content = [
+                {
+                    "type": "text",
+                    "text": static_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        return [
+            {"role": "system", "content": static_content},
+            *history_messages,
+            {"role": "system", "content": dynamic_prompt},
+        ]
+
     def trans_state(
         self, new_state: Union[CounselorState, EmotionState], reason: str = ""
     ):
@@ -148,14 +358,44 @@ class ChatBot:
         """
         raise NotImplementedError("Subclasses must implement trans_state method")
 
+    def _response_cache_key(self, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        启用缓存时计算请求消息的缓存键
+        消息中包含系统提示词的当前状态部分，状态不同不会命中
+        """
+        if not self.cache:
+            return None
+        return hash_prompt(self.model, to_json(messages).decode())
+
+    def _record_response(
+        self, content: str, reasoning: Optional[str], cache_key: Optional[str]
+    ) -> None:
+        """写入响应缓存并记录追踪事件"""
+        if cache_key:
+            get_response_cache(type(self).__name__).set(cache_key, content)
+        current_span().add_event(
+            name="reasoning.generated",
+            attributes={
+                "llm.reasoning": reasoning,
+                "llm.response": content,
+            },
+        )
+
     async def chat(self, history: List[ConversationMessage]) -> str:
         if not self.llm_client or not self.model:
             raise ValueError("LLM client and model must be configured in subclass")
 
+        # 对话轮数直接取最后一条消息的轮次，无需遍历历史计数
+        self.current_round = history[-1].round_number if history else 0
+
         # 构建消息列表
-        messages = [
-            {"role": "system", "content": self.system_prompt}
-        ] + self.convert_history_to_messages(history)
+        messages = self.build_messages(history)
+
+        # 先查缓存，仅在未命中时请求LLM
+        cache_key = self._response_cache_key(messages)
+        cached = _cached_reply(self, cache_key)
+        if cached is not None:
+            return cached
 
         try:
             response = await self.llm_client.chat.completions.create(
@@ -166,19 +406,72 @@ class ChatBot:
             )
 
             self.usage = response.usage
-            current_span = trace.get_current_span()
-            current_span.add_event(
-                name="reasoning.generated",
-                attributes={
-                    "llm.reasoning": response.choices[0].message.reasoning_content,
-                    "llm.response": response.choices[0].message.content.strip()
-                },
+            message = response.choices[0].message
+            content = message.content.strip()
+            self._record_response(content, message.reasoning_content, cache_key)
+            return content
+
+        except Exception as e:
+            raise RuntimeError(f"LLM API call failed: {str(e)}")
+
+    async def chat_stream(
+        self, history: List[ConversationMessage]
+    ) -> AsyncIterator[str]:
+        """
+        流式生成回复，按到达顺序逐段返回增量内容，用于界面实时展示
+        生成结束后与 chat() 一样记录 usage、缓存和追踪事件，
+        完整回复为全部片段拼接后去除首尾空白的结果
+
+        Args:
+            history: 完整的对话历史
+
+        Yields:
+            str: 回复内容的增量片段
+        """
+        if not self.llm_client or not self.model:
+            raise ValueError("LLM client and model must be configured in subclass")
+
+        self.current_round = history[-1].round_number if history else 0
+        messages = self.build_messages(history)
+
+        cache_key = self._response_cache_key(messages)
+        cached = _cached_reply(self, cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+        # 不支持 include_usage 的服务商不会返回用量，此时 usage 保持为 None
+        self.usage = None
+        parts: List[str] = []
+        reasoning_parts: List[str] = []
+        try:
+            stream = await self.llm_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
             )
-            return response.choices[0].message.content.strip()
+            async for chunk in stream:
+                if chunk.usage:
+                    self.usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                reasoning = getattr(delta, "reasoning_content", None)
+                if reasoning:
+                    reasoning_parts.append(reasoning)
+                if delta.content:
+                    parts.append(delta.content)
+                    yield delta.content
 
         except Exception as e:
             raise RuntimeError(f"LLM API call failed: {str(e)}")
 
+        self._record_response(
+            "".join(parts).strip(), "".join(reasoning_parts) or None, cache_key
+        )
+
     def update_state(
         self, new_state: Union[CounselorState, EmotionState], reason: str = ""
     ):
@@ -244,17 +537,34 @@ class Agent(Generic[TContext, TResult]):
     context_class: Type[TContext] = None
     result_class: Type[TResult] = None
 
-    def __init__(self, **kwargs):
+    # 是否按提示词哈希缓存结果，相同输入直接返回缓存，不再请求LLM
+    cache_responses: bool = False
+
+    # 静态提示词（角色说明、输出格式等每次请求都相同的内容），作为 system 消息放在最前，
+    # 便于服务端复用前缀缓存；设置后 prompt() 只需返回随上下文变化的部分
+    static_prompt: Optional[str] = None
+
+    def __init__(
+        self,
+        cache: Optional[bool] = None,
+        llm_client: Optional[AsyncOpenAI] = None,
+        **kwargs,
+    ):
         """
         初始化Agent
 
         Args:
+            cache: 是否启用响应缓存，为空时使用类上的 cache_responses 默认值
+            llm_client: 共享的LLM客户端，为空时创建新的客户端
             **kwargs: 其他初始化参数
         """
         # LLM客户端配置（子类中具体实现）
-        self.llm_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.llm_client = llm_client or AsyncOpenAI(
+            api_key=self.api_key, base_url=self.base_url
+        )
         self.config = kwargs
         self.usage = None
+        self.cache = self.cache_responses if cache is None else cache
 
     def prompt(self, context: TContext) -> str:
         """
@@ -263,6 +573,22 @@ class Agent(Generic[TContext, TResult]):
         """
         raise NotImplementedError("Subclasses must implement prompt method")
 
+    def build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """
+        构建请求消息，静态提示词作为 system 消息在前，动态提示词作为 user 消息
+
+        Args:
+            prompt: prompt() 返回的提示词
+
+        Returns:
+            List[Dict[str, str]]: 请求消息列表
+        """
+        messages = []
+        if self.static_prompt:
+            messages.append({"role": "system", "content": self.static_prompt})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
     def clean_response_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """
         清理LLM返回的JSON数据，确保符合result_class的结构
@@ -285,19 +611,39 @@ class Agent(Generic[TContext, TResult]):
         if not self.result_class:
             raise ValueError("result_class must be set in subclass")
         try:
-            messages = [{"role": "user", "content": self.prompt(context)}]
+            messages = self.build_messages(self.prompt(context))
+
+            # 先查缓存，仅在未命中时请求LLM
+            cache_key = (
+                hash_prompt(self.model, *(message["content"] for message in messages))
+                if self.cache
+                else None
+            )
+            cached = _cached_reply(self, cache_key)
+            if cached is not None:
+                try:
+                    self.data = self.result_class.model_validate_json(cached)
+                    return self.data
+                except ValidationError:
+                    # 结果模型变更后旧缓存不再符合结构，按未命中处理，重新请求后覆盖
+                    pass
+
             response = await self.llm_client.chat.completions.parse(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.max_tokens,
-                response_format=self.result_class,
+                response_format=response_format_for(self.result_class),
             )
             resp_content = response.choices[0].message.content.strip()
-            resp_data = self.clean_response_data(json.loads(resp_content))
+            # 使用 pydantic-core 的 Rust JSON 解析器，比标准库 json 更快
+            resp_data = self.clean_response_data(from_json(resp_content))
             self.data = self.result_class(**resp_data)
+            if cache_key:
+                get_response_cache(type(self).__name__).set(
+                    cache_key, self.data.model_dump_json()
+                )
             self.usage = response.usage
-            current_span = trace.get_current_span()
-            current_span.add_event(
+            current_span().add_event(
                 name="reasoning.generated",
                 attributes={
                     "llm.reasoning": response.choices[0].message.reasoning_content,
@@ -311,6 +657,37 @@ class Agent(Generic[TContext, TResult]):
             raise RuntimeError(f"LLM API call failed: {str(e)}") from e
 
 
+# 特别高风险的关键词，命中时额外加权
+HIGH_RISK_KEYWORDS = ("自杀", "想死", "结束生命", "割腕", "杀死")
+
+
+@lru_cache(maxsize=None)
+def keyword_pattern(keywords: tuple) -> re.Pattern:
+    """
+    将一组关键词编译为单个正则，一次扫描即可判断是否命中任一关键词
+    关键词可通过环境变量配置，可能包含英文，因此不区分大小写
+    """
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+
+def match_keywords(content: str, keywords: List[str]) -> List[str]:
+    """
+    找出内容中出现的关键词
+
+    Args:
+        content: 待检查的内容
+        keywords: 关键词列表
+
+    Returns:
+        List[str]: 出现的关键词（按关键词列表顺序，不重复，不区分大小写）
+    """
+    # 绝大多数内容不含任何关键词，先用编译好的正则整体扫描一次，命中后再逐个确认
+    if not keyword_pattern(tuple(keywords)).search(content):
+        return []
+    content_folded = content.casefold()
+    return [kw for kw in keywords if kw.casefold() in content_folded]
+
+
 class RiskAssessmentMixin:
     """
     风险评估混入类
@@ -328,30 +705,29 @@ class RiskAssessmentMixin:
             RiskAssessment: 风险评估结果
         """
         risk_keywords = settings.get_risk_keywords()
+        suicide_keywords = risk_keywords["suicide"]
+        self_harm_keywords = risk_keywords["self_harm"]
+        harm_others_keywords = risk_keywords["harm_others"]
+
+        # 先用所有关键词合成的正则整体扫描一次，未命中时无需再逐类匹配
+        all_keywords = (*suicide_keywords, *self_harm_keywords, *harm_others_keywords)
+        if keyword_pattern(all_keywords).search(content):
+            # 每类关键词只扫描一次，风险等级和风险指标共用匹配结果
+            suicide_matched = match_keywords(content, suicide_keywords)
+            self_harm_matched = match_keywords(content, self_harm_keywords)
+            harm_others_matched = match_keywords(content, harm_others_keywords)
+        else:
+            suicide_matched = self_harm_matched = harm_others_matched = []
 
         # 计算各类风险等级
-        suicide_risk = self._calculate_risk_level(content, risk_keywords["suicide"])
-        self_harm_risk = self._calculate_risk_level(content, risk_keywords["self_harm"])
-        harm_others_risk = self._calculate_risk_level(
-            content, risk_keywords["harm_others"]
-        )
+        suicide_risk = self._score_risk_level(content, suicide_matched)
+        self_harm_risk = self._score_risk_level(content, self_harm_matched)
+        harm_others_risk = self._score_risk_level(content, harm_others_matched)
 
         overall_risk = max(suicide_risk, self_harm_risk, harm_others_risk)
 
         # 收集触发的风险指标
-        risk_indicators = []
-        if suicide_risk > 0:
-            risk_indicators.extend(
-                [kw for kw in risk_keywords["suicide"] if kw in content]
-            )
-        if self_harm_risk > 0:
-            risk_indicators.extend(
-                [kw for kw in risk_keywords["self_harm"] if kw in content]
-            )
-        if harm_others_risk > 0:
-            risk_indicators.extend(
-                [kw for kw in risk_keywords["harm_others"] if kw in content]
-            )
+        risk_indicators = suicide_matched + self_harm_matched + harm_others_matched
 
         return RiskAssessment(
             suicide_risk=suicide_risk,
@@ -373,9 +749,19 @@ class RiskAssessmentMixin:
         Returns:
             int: 风险等级 (0-5)
         """
-        content_lower = content.lower()
-        matched_keywords = [kw for kw in keywords if kw in content_lower]
+        return self._score_risk_level(content, match_keywords(content, keywords))
 
+    def _score_risk_level(self, content: str, matched_keywords: List[str]) -> int:
+        """
+        根据已匹配的关键词计算风险等级
+
+        Args:
+            content: 内容
+            matched_keywords: 内容中出现的该类风险关键词
+
+        Returns:
+            int: 风险等级 (0-5)
+        """
         if not matched_keywords:
             return 0
 
@@ -383,9 +769,8 @@ class RiskAssessmentMixin:
         risk_score = len(matched_keywords)
 
         # 特别高风险的关键词加权
-        high_risk_keywords = ["自杀", "想死", "结束生命", "割腕", "杀死"]
-        for kw in high_risk_keywords:
-            if kw in content_lower:
+        for kw in HIGH_RISK_KEYWORDS:
+            if kw in content:
                 risk_score += 2
 
         # 转换为0-5的等级
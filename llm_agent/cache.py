@@ -0,0 +1,94 @@
+"""
+LLM响应缓存
+以提示词哈希为键缓存LLM响应，命中时直接返回，跳过重复的API调用
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from settings import settings
+
+
+def hash_prompt(*parts: str) -> str:
+    """
+    计算提示词的 BLAKE2b 哈希，作为缓存键
+
+    Args:
+        *parts: 参与哈希的各部分内容（模型名、提示词等）
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    hasher = hashlib.blake2b(digest_size=32)
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")  # 分隔符，避免不同切分方式产生相同的哈希
+    return hasher.hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+    进程内 LRU 字典优先，未命中时再读取磁盘上的缓存文件
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        cache_dir: Optional[str] = None,
+        max_memory_entries: int = 256,
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            namespace: 缓存命名空间，不同Agent的缓存互相隔离
+            cache_dir: 缓存根目录，为空时仅使用内存缓存
+            max_memory_entries: 内存中最多保留的条数，超出时淘汰最久未使用的条目
+        """
+        self.cache_dir = os.path.join(cache_dir, namespace) if cache_dir else None
+        self.max_memory_entries = max_memory_entries
+        self._memory: OrderedDict[str, str] = OrderedDict()
+
+    def _remember(self, key: str, value: str) -> None:
+        """写入内存缓存，超出容量时淘汰最久未使用的条目"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中时返回None"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        if self.cache_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read()
+                self._remember(key, value)
+                return value
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """写入缓存"""
+        self._remember(key, value)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self._path(key), "w", encoding="utf-8") as f:
+                f.write(value)
+
+
+@lru_cache(maxsize=None)
+def get_response_cache(namespace: str) -> ResponseCache:
+    """获取指定命名空间的响应缓存（进程内单例）"""
+    return ResponseCache(
+        namespace, settings.LLM_CACHE_DIR, settings.LLM_CACHE_MEMORY_SIZE
+    )
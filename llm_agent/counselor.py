@@ -3,9 +3,11 @@
 模拟专业心理咨询师在不同阶段的咨询行为和技巧运用
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
-from traceloop.sdk.decorators import agent
+from openai import AsyncOpenAI
+
+from llm_agent.tracing import agent
 
 from llm_agent.base import ChatBot, convert_history_for_counselor
 from models import (
@@ -21,17 +23,24 @@ from constants import (
 
 
 @agent(name="咨询师 Bot", method_name="chat")
+@agent(name="咨询师 Bot", method_name="chat_stream")
 class CounselorBot(ChatBot):
     """
     咨询师Bot
     实现专业的心理咨询师行为，根据不同状态提供相应的咨询服务
     """
 
-    def __init__(self):
+    def __init__(
+        self, llm_client: Optional[AsyncOpenAI] = None, cache: Optional[bool] = None
+    ):
         """
         初始化咨询师Bot
+
+        Args:
+            llm_client: 共享的LLM客户端，为空时创建新的客户端
+            cache: 是否启用回复缓存，为空时使用类上的 cache_responses 默认值
         """
-        super().__init__()
+        super().__init__(llm_client, cache)
         # 状态管理
         self.current_state: CounselorState = CounselorState.INTRODUCTION
         self.state_history: List[Dict[str, Any]] = []
@@ -41,6 +50,10 @@ class CounselorBot(ChatBot):
 
         self.counselor_background: Optional[CounselorBackground] = None
         self.student_basic_info: Optional[StudentBasicInfo] = None
+        # 系统提示词中不随阶段变化的部分，设置背景时生成
+        self._base_prompt: Optional[str] = None
+        # 各阶段提示词只取决于背景信息，按阶段缓存
+        self._state_prompts: Dict[CounselorState, str] = {}
 
     def update_background(
         self,
@@ -63,6 +76,8 @@ class CounselorBot(ChatBot):
             counselor_background.therapy_approach, {}
         )
         self.typical_questions = self.approach_data.get("typical_questions", [])
+        self._base_prompt = self._build_base_prompt()
+        self._state_prompts = {}
 
     @property
     def state_prompt(self) -> str:
@@ -186,13 +201,27 @@ class CounselorBot(ChatBot):
         if not self.counselor_background:
             raise ValueError("未配置咨询师基础背景信息")
 
-        # 获取流派信息
-        approach_data = THERAPY_APPROACHES_DATA.get(
-            self.counselor_background.therapy_approach, {}
-        )
+        return self._base_prompt + self._get_state_prompt()
+
+    def split_system_prompt(self) -> Tuple[Optional[str], str]:
+        """拆分系统提示词：角色、流派与学生信息在整个会话内不变，作为静态前缀"""
+        if not self.counselor_background:
+            raise ValueError("未配置咨询师基础背景信息")
+
+        return self._base_prompt, self._get_state_prompt()
+
+    def _get_state_prompt(self) -> str:
+        """获取当前阶段的提示词，每个阶段只渲染一次"""
+        prompt = self._state_prompts.get(self.current_state)
+        if prompt is None:
+            prompt = self._state_prompts[self.current_state] = self.state_prompt
+        return prompt
+
+    def _build_base_prompt(self) -> str:
+        """构建系统提示词中的静态部分（角色、流派特点、学生信息与规则）"""
+        approach_data = self.approach_data
 
-        # 基础咨询师信息
-        base_prompt = f"""# Role: 心理咨询师
+        return f"""# Role: 心理咨询师
 你是一名专业的心理咨询师，主要采用{approach_data.get("name", "综合取向")}流派进行咨询。你的工作是帮助来访者探索和理解他们的情感和问题，提供专业的支持和指导。
 你需要始终保持专业的咨询师身份，根据来访者的反应调整咨询节奏，并使用适当的咨询技巧。
 
@@ -214,7 +243,6 @@ class CounselorBot(ChatBot):
 3. **严格根据流程限制**：遵循咨询流程的各个阶段，不跳过任何步骤，不在步骤进行过程中提出结束或跳过阶段的内容。
 
 """
-        return base_prompt + self.state_prompt
 
     def trans_state(self, new_state: CounselorState, reason: str = ""):
         """转换到新状态"""
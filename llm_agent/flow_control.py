@@ -3,9 +3,9 @@
 负责分析对话进展，判断状态转换时机，评估风险等级，并准确评估学生心理状态指标
 """
 
-from typing import Dict, List, Literal, Optional, Any
+from typing import Dict, List, Literal, Optional, Any, Tuple
 
-from traceloop.sdk.decorators import agent
+from .tracing import agent
 
 from .base import Agent, RiskAssessmentMixin
 from models import (
@@ -30,6 +30,23 @@ STATE_TRANSITION_GRAPH = {
     CounselorState.SCALE_RECOMMENDATION: [],  # 终止状态
 }
 
+# 取值范围为 0-1 的学生状态评分字段
+STUDENT_SCORE_FIELDS = (
+    "trust_level",
+    "openness_level",
+    "information_revealed",
+    "resistance_level",
+    "avoidance_tendency",
+)
+
+# 取值范围为 0-5 的风险等级字段
+RISK_LEVEL_FIELDS = (
+    "overall_risk_level",
+    "suicide_risk",
+    "self_harm_risk",
+    "harm_others_risk",
+)
+
 
 class FlowControlContext(BaseModel):
     """流程控制Agent上下文"""
@@ -214,6 +231,9 @@ class FlowControlAgent(
     context_class = FlowControlContext
     result_class = FlowControlResult
 
+    # 背景信息在会话内不变，缓存最近一次的 (背景信息对象, 格式化结果)
+    _background_cache: Tuple[Optional[BackgroundInfo], str] = (None, "")
+
     def prompt(self, context: FlowControlContext) -> str:
         """
         构建流程控制评估的提示词
@@ -333,6 +353,10 @@ class FlowControlAgent(
         if not background_info:
             return "\n## 学生背景信息\n背景信息缺失\n"
 
+        cached_background, cached_text = self._background_cache
+        if background_info is cached_background:
+            return cached_text
+
         student = background_info.student_info
         counselor = background_info.counselor_info
 
@@ -346,12 +370,12 @@ class FlowControlAgent(
         )
         approach_data = THERAPY_APPROACHES_DATA.get(counselor.therapy_approach, {})
 
-        return f"""
+        text = f"""
 ## 学生背景信息
 ### 基本信息
 - 年龄：{student.age}岁，{student.gender}
 - 学业：{student.grade}，{student.major}专业
-- 性格特征：{", ".join(student.personality_traits)}
+- 性格特征：{student.personality_traits_joined}
 
 ### 心理状况
 - 核心问题：{issue_str}
@@ -362,8 +386,10 @@ class FlowControlAgent(
 ### 咨询师信息
 - 治疗流派：{approach_data.get("name", "未知流派")}
 - 沟通风格：{counselor.communication_style}
-- 专业领域：{", ".join(counselor.specialization)}
+- 专业领域：{counselor.specialization_joined}
 """
+        self._background_cache = (background_info, text)
+        return text
 
     def _format_current_student_state(self, context: FlowControlContext) -> str:
         """格式化当前学生状态（用于对比分析）"""
@@ -434,7 +460,7 @@ class FlowControlAgent(
 - 不允许状态回退或跳跃
 """
 
-    async def update_student_bot_state(self, student_bot, result: FlowControlResult):
+    def update_student_bot_state(self, student_bot, result: FlowControlResult):
         """
         根据评估结果更新学生Bot的状态
 
@@ -530,15 +556,7 @@ class FlowControlAgent(
         student_analysis = data.get("student_state_analysis", {})
 
         # 确保所有评分在0-1范围内
-        numeric_fields = [
-            "trust_level",
-            "openness_level",
-            "information_revealed",
-            "resistance_level",
-            "avoidance_tendency",
-        ]
-
-        for field in numeric_fields:
+        for field in STUDENT_SCORE_FIELDS:
             if field in student_analysis:
                 value = student_analysis[field]
                 if not isinstance(value, (int, float)) or not (0 <= value <= 1):
@@ -547,14 +565,7 @@ class FlowControlAgent(
 
         # 验证风险等级
         risk_assessment = data.get("risk_assessment", {})
-        risk_fields = [
-            "overall_risk_level",
-            "suicide_risk",
-            "self_harm_risk",
-            "harm_others_risk",
-        ]
-
-        for field in risk_fields:
+        for field in RISK_LEVEL_FIELDS:
             if field in risk_assessment:
                 value = risk_assessment[field]
                 if not isinstance(value, int) or not (0 <= value <= 5):
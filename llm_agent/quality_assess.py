@@ -3,17 +3,48 @@
 对完整的咨询对话进行全面质量评估，生成结构化的评估报告
 """
 
-from typing import Dict, List, Literal, Optional, Any
+from functools import lru_cache
+from typing import Dict, Iterator, List, Literal, Optional, TypedDict
 
-from traceloop.sdk.decorators import agent
+from .tracing import agent
 
 from .base import Agent
 from models import (
     ConversationMessage,
     BackgroundInfo,
+    CounselorState,
+    EmotionState,
 )
 from constants import PSYCHOLOGICAL_ISSUES_DATA, THERAPY_APPROACHES_DATA
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class ResultModel(BaseModel):
+    """
+    评估结果模型基类：结果生成后只读
+    忽略 schema 以外的字段，兼容不严格执行 json_schema 的服务商返回的多余字段
+    """
+
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
+
+class TrajectoryTransition(TypedDict, total=False):
+    """咨询轨迹中的一次状态转换"""
+
+    round: int
+    timestamp: str
+    from_state: str
+    to_state: Optional[str]
+    reason: str
+    auto_end: bool
+
+
+class TrajectoryDict(TypedDict, total=False):
+    """咨询轨迹信息"""
+
+    state_transitions: List[TrajectoryTransition]
+    rounds_per_state: Dict[str, int]
+    total_rounds: int
 
 
 class QualityAssessmentContext(BaseModel):
@@ -23,12 +54,12 @@ class QualityAssessmentContext(BaseModel):
     conversation_history: List[ConversationMessage] = Field(
         ..., description="完整对话历史"
     )
-    counseling_trajectory: Optional[Dict[str, Any]] = Field(
+    counseling_trajectory: Optional[TrajectoryDict] = Field(
         None, description="咨询轨迹信息"
     )
 
 
-class CoreIssueIdentification(BaseModel):
+class CoreIssueIdentification(ResultModel):
     """核心问题识别"""
 
     identified_issue: str = Field(..., description="咨询师识别出的核心问题")
@@ -38,7 +69,7 @@ class CoreIssueIdentification(BaseModel):
     analysis: str = Field(..., description="准确性分析")
 
 
-class StateTransition(BaseModel):
+class StateTransition(ResultModel):
     """状态转换"""
 
     from_state: str = Field(..., description="起始状态")
@@ -50,7 +81,7 @@ class StateTransition(BaseModel):
     reason: str = Field(..., description="转换是否合理的分析")
 
 
-class IntroductionPhase(BaseModel):
+class IntroductionPhase(ResultModel):
     """介绍阶段"""
 
     rounds_used: int
@@ -59,7 +90,7 @@ class IntroductionPhase(BaseModel):
     missed_opportunities: List[str]
 
 
-class ExplorationPhase(BaseModel):
+class ExplorationPhase(ResultModel):
     """探索阶段"""
 
     rounds_used: int
@@ -69,7 +100,7 @@ class ExplorationPhase(BaseModel):
     missed_opportunities: List[str]
 
 
-class AssessmentPhase(BaseModel):
+class AssessmentPhase(ResultModel):
     """评估阶段"""
 
     rounds_used: int
@@ -79,7 +110,7 @@ class AssessmentPhase(BaseModel):
     missed_opportunities: List[str]
 
 
-class ScaleRecommendationPhase(BaseModel):
+class ScaleRecommendationPhase(ResultModel):
     """量表推荐阶段"""
 
     rounds_used: int
@@ -89,7 +120,7 @@ class ScaleRecommendationPhase(BaseModel):
     missed_opportunities: List[str]
 
 
-class PhaseEffectiveness(BaseModel):
+class PhaseEffectiveness(ResultModel):
     """各阶段效果"""
 
     introduction_phase: IntroductionPhase
@@ -98,14 +129,14 @@ class PhaseEffectiveness(BaseModel):
     scale_recommendation_phase: ScaleRecommendationPhase
 
 
-class CounselingTrajectory(BaseModel):
+class CounselingTrajectory(ResultModel):
     """咨询轨迹"""
 
     state_transitions: List[StateTransition]
     phase_effectiveness: PhaseEffectiveness
 
 
-class EmpathySkills(BaseModel):
+class EmpathySkills(ResultModel):
     """共情技巧"""
 
     score: float = Field(..., ge=0, le=10, description="0-10评分")
@@ -113,7 +144,7 @@ class EmpathySkills(BaseModel):
     improvement_areas: List[str]
 
 
-class QuestioningSkills(BaseModel):
+class QuestioningSkills(ResultModel):
     """提问技巧"""
 
     score: float = Field(..., ge=0, le=10)
@@ -124,7 +155,7 @@ class QuestioningSkills(BaseModel):
     examples: List[str]
 
 
-class ReflectionSkills(BaseModel):
+class ReflectionSkills(ResultModel):
     """反映技巧"""
 
     score: float = Field(..., ge=0, le=10)
@@ -133,7 +164,7 @@ class ReflectionSkills(BaseModel):
     examples: List[str]
 
 
-class TherapeuticApproach(BaseModel):
+class TherapeuticApproach(ResultModel):
     """治疗流派"""
 
     approach_consistency: str = Field(
@@ -143,7 +174,7 @@ class TherapeuticApproach(BaseModel):
     technique_mastery: str = Field(..., description="对流派技术的掌握程度评估")
 
 
-class TechniqueAnalysis(BaseModel):
+class TechniqueAnalysis(ResultModel):
     """技巧分析"""
 
     empathy_skills: EmpathySkills
@@ -152,7 +183,7 @@ class TechniqueAnalysis(BaseModel):
     therapeutic_approach: TherapeuticApproach
 
 
-class ProfessionalBoundaries(BaseModel):
+class ProfessionalBoundaries(ResultModel):
     """专业边界"""
 
     maintained_boundaries: bool
@@ -160,7 +191,7 @@ class ProfessionalBoundaries(BaseModel):
     professionalism_score: float = Field(..., ge=0, le=10, description="0-10评分")
 
 
-class CounselingTechniques(BaseModel):
+class CounselingTechniques(ResultModel):
     """咨询技巧"""
 
     overall_score: float = Field(..., ge=0, le=10, description="0-10的总体技巧评分")
@@ -168,7 +199,7 @@ class CounselingTechniques(BaseModel):
     professional_boundaries: ProfessionalBoundaries
 
 
-class TrustBuilding(BaseModel):
+class TrustBuilding(ResultModel):
     """信任建立"""
 
     initial_trust: float = Field(..., ge=0, le=10, description="0-10评分")
@@ -177,7 +208,7 @@ class TrustBuilding(BaseModel):
     trust_building_techniques: List[str]
 
 
-class RapportQuality(BaseModel):
+class RapportQuality(ResultModel):
     """关系质量"""
 
     score: float = Field(..., ge=0, le=10)
@@ -185,7 +216,7 @@ class RapportQuality(BaseModel):
     relationship_challenges: List[str]
 
 
-class ClientEngagement(BaseModel):
+class ClientEngagement(ResultModel):
     """来访者参与度"""
 
     initial_engagement: float = Field(..., ge=0, le=10)
@@ -194,7 +225,7 @@ class ClientEngagement(BaseModel):
     engagement_strategies: List[str]
 
 
-class TherapeuticRelationship(BaseModel):
+class TherapeuticRelationship(ResultModel):
     """治疗关系"""
 
     trust_building: TrustBuilding
@@ -202,7 +233,7 @@ class TherapeuticRelationship(BaseModel):
     client_engagement: ClientEngagement
 
 
-class ClientInsightGained(BaseModel):
+class ClientInsightGained(ResultModel):
     """来访者获得的洞察"""
 
     score: float = Field(..., ge=0, le=10, description="0-10评分")
@@ -210,7 +241,7 @@ class ClientInsightGained(BaseModel):
     self_awareness_improvement: str
 
 
-class ProblemUnderstanding(BaseModel):
+class ProblemUnderstanding(ResultModel):
     """问题理解"""
 
     initial_understanding: str
@@ -218,7 +249,7 @@ class ProblemUnderstanding(BaseModel):
     understanding_improvement: str
 
 
-class HopeAndMotivation(BaseModel):
+class HopeAndMotivation(ResultModel):
     """希望与动机"""
 
     hope_level: float = Field(..., ge=0, le=10, description="0-10评分")
@@ -226,7 +257,7 @@ class HopeAndMotivation(BaseModel):
     future_orientation: str
 
 
-class OutcomeAssessment(BaseModel):
+class OutcomeAssessment(ResultModel):
     """结果评估"""
 
     client_insight_gained: ClientInsightGained
@@ -234,7 +265,7 @@ class OutcomeAssessment(BaseModel):
     hope_and_motivation: HopeAndMotivation
 
 
-class OverallQuality(BaseModel):
+class OverallQuality(ResultModel):
     """整体质量"""
 
     total_score: float = Field(..., ge=0, le=10, description="0-10的总体质量评分")
@@ -245,7 +276,7 @@ class OverallQuality(BaseModel):
     missed_opportunities: List[str] = Field(..., description="错失的重要机会")
 
 
-class Recommendations(BaseModel):
+class Recommendations(ResultModel):
     """建议"""
 
     immediate_actions: List[str] = Field(..., description="立即需要采取的行动")
@@ -254,7 +285,7 @@ class Recommendations(BaseModel):
     supervision_focus: List[str] = Field(..., description="督导重点建议")
 
 
-class ConsistencyCheckModel(BaseModel):
+class ConsistencyCheckModel(ResultModel):
     """一致性检查"""
 
     issue_consistency: bool
@@ -264,7 +295,7 @@ class ConsistencyCheckModel(BaseModel):
     consistency_score: float = Field(..., ge=0, le=10, description="0-10评分")
 
 
-class QualityAssessmentResult(BaseModel):
+class QualityAssessmentResult(ResultModel):
     """
     咨询质量评估结果的完整数据模型
     """
@@ -423,21 +454,7 @@ interface QualityAssessmentResult {
 """
 
 
-@agent(name="质量评估 Agent", method_name="execute")
-class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentResult]):
-    """
-    质量评估Agent
-    对完整的咨询会话进行综合质量评估
-    """
-
-    context_class = QualityAssessmentContext
-    result_class = QualityAssessmentResult
-
-    def prompt(self, context: QualityAssessmentContext) -> str:
-        """
-        构建质量评估的提示词
-        """
-        base_prompt = """# Role: 心理咨询质量评估专家
+quality_assessment_base_prompt = """# Role: 心理咨询质量评估专家
 你是一名资深的心理咨询督导专家，请对以下完整的心理咨询对话进行全面的质量评估。请基于专业的心理咨询标准进行评估，分析咨询师在各个阶段的表现，确保评估结果的客观性和建设性。
 
 ## 评估任务：
@@ -457,15 +474,69 @@ class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentRe
 - 评估要公正客观，既要指出优点也要指出不足
 """
 
-        # 构建完整的提示词
-        prompt = (
-            base_prompt
-            + quality_assessment_format_prompt
-            + self._format_background_info(context.background_info)
-            + self._format_conversation_history(context.conversation_history)
-            + self._format_counseling_trajectory(context.counseling_trajectory)
+
+# 对话角色 -> 中文名称
+ROLE_NAMES = {"student": "学生", "counselor": "咨询师"}
+
+# 咨询师状态、情绪 -> 对话记录中的标注文本，逐行格式化时直接查表
+STATE_LABELS = {state.value: f"[{state.value}]" for state in CounselorState}
+EMOTION_LABELS = {emotion: f"(情绪: {emotion.value})" for emotion in EmotionState}
+
+
+@lru_cache(maxsize=256)
+def _format_issue(issue: str) -> str:
+    """格式化心理问题描述，未收录的问题类型原样返回"""
+    issue_data = PSYCHOLOGICAL_ISSUES_DATA.get(issue, {})
+    if not issue_data:
+        return issue
+    return f"{issue_data.get('name', '未知')} - {issue_data.get('description', '')}"
+
+
+@lru_cache(maxsize=256)
+def _issue_name(issue: str) -> str:
+    """获取心理问题名称"""
+    return PSYCHOLOGICAL_ISSUES_DATA.get(issue, {}).get("name", "未知问题")
+
+
+@lru_cache(maxsize=256)
+def _format_approach(approach: str) -> str:
+    """格式化咨询流派描述"""
+    approach_data = THERAPY_APPROACHES_DATA.get(approach, {})
+    return (
+        f"{approach_data.get('name', '未知')} - {approach_data.get('description', '')}"
+    )
+
+
+# 静态提示词（角色说明 + 输出格式），每次调用都相同，作为 system 消息单独发送
+quality_assessment_static_prompt = (
+    quality_assessment_base_prompt + quality_assessment_format_prompt
+)
+
+
+@agent(name="质量评估 Agent", method_name="execute")
+class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentResult]):
+    """
+    质量评估Agent
+    对完整的咨询会话进行综合质量评估
+    """
+
+    context_class = QualityAssessmentContext
+    result_class = QualityAssessmentResult
+    cache_responses = True
+    static_prompt = quality_assessment_static_prompt
+
+    def prompt(self, context: QualityAssessmentContext) -> str:
+        """
+        构建质量评估的提示词
+        """
+        # 角色说明和输出格式作为 static_prompt 单独发送，这里只拼接动态部分
+        return "".join(
+            [
+                self._format_background_info(context.background_info),
+                self._format_conversation_history(context.conversation_history),
+                self._format_counseling_trajectory(context.counseling_trajectory),
+            ]
         )
-        return prompt
 
     def _format_background_info(self, background_info: BackgroundInfo) -> str:
         """格式化背景信息"""
@@ -475,32 +546,22 @@ class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentRe
         student = background_info.student_info
         counselor = background_info.counselor_info
 
-        issue_data = PSYCHOLOGICAL_ISSUES_DATA.get(
-            student.current_psychological_issue, {}
-        )
-        issue_str = (
-            f"{issue_data.get('name', '未知')} - {issue_data.get('description', '')}"
-            if issue_data
-            else student.current_psychological_issue
-        )
-        approach_data = THERAPY_APPROACHES_DATA.get(counselor.therapy_approach, {})
-
         return f"""## 背景信息：
 ### 学生背景：
 - 基本信息：{student.age}岁，{student.grade}，{student.major}
-- 性格特征：{", ".join(student.personality_traits)}
+- 性格特征：{student.personality_traits_joined}
 - 家庭背景：{student.family_background}
-- 心理问题：{issue_str}
+- 心理问题：{_format_issue(student.current_psychological_issue)}
 - 症状描述：{student.symptom_description}
 - 深层信息：{student.hidden_personal_info}
 
 ### 咨询师背景：
-- 咨询流派：{approach_data.get("name", "未知")} - {approach_data.get("description", "")}
+- 咨询流派：{_format_approach(counselor.therapy_approach)}
 - 沟通风格：{counselor.communication_style}
-- 专业领域：{", ".join(counselor.specialization)}
+- 专业领域：{counselor.specialization_joined}
 
 ### 原始设定心理问题：
-{issue_data.get("name", "未知问题")}
+{_issue_name(student.current_psychological_issue)}
 """
 
     def _format_conversation_history(self, history: List[ConversationMessage]) -> str:
@@ -508,26 +569,44 @@ class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentRe
         if not history:
             return "## 完整对话记录：\n无对话记录"
 
-        formatted = []
-        for i, msg in enumerate(history):
-            role_name = "学生" if msg.role == "student" else "咨询师"
-            state_info = (
-                f"[{msg.state}]" if msg.state and msg.role == "counselor" else ""
-            )
-            emotion_info = (
-                f"(情绪: {msg.emotion.value})"
-                if msg.emotion and msg.role == "counselor"
-                else ""
-            )
-
-            formatted.append(
-                f"{(i + 1):2d}. {role_name}{state_info}{emotion_info}: {msg.content}"
-            )
-
-        return "## 完整对话记录：\n" + "\n".join(formatted) + "\n\n"
+        return (
+            "## 完整对话记录：\n"
+            "（咨询师的阶段和情绪标注仅在发生变化时给出；同一角色的连续发言以“·”续行）\n"
+            + "\n".join(self._iter_history_lines(history))
+            + "\n\n"
+        )
+
+    def _iter_history_lines(self, history: List[ConversationMessage]) -> Iterator[str]:
+        """
+        逐条生成对话记录行
+        连续的同角色消息合并为一段，咨询师的状态和情绪只在变化时标注，减少提示词长度
+        """
+        index = 0
+        last_role = last_state = last_emotion = None
+        for msg in history:
+            role = msg.role
+            state_info = emotion_info = ""
+            # 状态和情绪标注仅针对咨询师消息
+            if role == "counselor":
+                state = msg.state
+                if state and state != last_state:
+                    state_info = STATE_LABELS.get(state) or f"[{state}]"
+                    last_state = state
+                emotion = msg.emotion
+                if emotion and emotion != last_emotion:
+                    emotion_info = EMOTION_LABELS[emotion]
+                    last_emotion = emotion
+
+            if role == last_role and not state_info and not emotion_info:
+                yield f"  · {msg.content}"
+                continue
+
+            index += 1
+            last_role = role
+            yield f"{index:2d}. {ROLE_NAMES[role]}{state_info}{emotion_info}: {msg.content}"
 
     def _format_counseling_trajectory(
-        self, trajectory: Optional[Dict[str, Any]]
+        self, trajectory: Optional[TrajectoryDict]
     ) -> str:
         """格式化咨询轨迹"""
         if not trajectory:
@@ -564,7 +643,6 @@ class QualityAssessmentAgent(Agent[QualityAssessmentContext, QualityAssessmentRe
 
 if __name__ == "__main__":
     import asyncio
-    import json
 
     # 示例背景信息和对话历史
     background_info = BackgroundInfo(
@@ -631,4 +709,4 @@ if __name__ == "__main__":
     agent = QualityAssessmentAgent()
     # 执行评估
     assessment_result = asyncio.run(agent.execute(context))
-    print(json.dumps(assessment_result.model_dump(), ensure_ascii=False, indent=2))
+    print(assessment_result.model_dump_json(indent=2))
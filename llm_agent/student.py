@@ -4,9 +4,12 @@
 """
 
 import random
-from typing import Dict, List, Any, Optional
+from collections import deque
+from typing import Deque, Dict, List, Any, Optional, Tuple
 
-from traceloop.sdk.decorators import agent
+from openai import AsyncOpenAI
+
+from llm_agent.tracing import agent
 
 from llm_agent.base import ChatBot, RiskAssessmentMixin, convert_history_for_student
 from models import (
@@ -17,21 +20,76 @@ from models import (
 )
 
 
+# 心理问题 -> 初始情绪状态
+ISSUE_INITIAL_EMOTIONS = {
+    PsychologicalIssue.ACADEMIC_ANXIETY: EmotionState.ANXIOUS,
+    PsychologicalIssue.SOCIAL_PHOBIA: EmotionState.ANXIOUS,
+    PsychologicalIssue.DEPRESSION: EmotionState.DEPRESSED,
+    PsychologicalIssue.PROCRASTINATION: EmotionState.CONFUSED,
+    PsychologicalIssue.OCD_SYMPTOMS: EmotionState.ANXIOUS,
+    PsychologicalIssue.ADAPTATION_ISSUES: EmotionState.CONFUSED,
+    PsychologicalIssue.RELATIONSHIP_ISSUES: EmotionState.DEPRESSED,
+    PsychologicalIssue.FAMILY_CONFLICTS: EmotionState.ANGRY,
+    PsychologicalIssue.IDENTITY_CONFUSION: EmotionState.CONFUSED,
+    PsychologicalIssue.SLEEP_PROBLEMS: EmotionState.ANXIOUS,
+}
+
+# 各情绪状态下的行为指导
+EMOTION_GUIDES = {
+    EmotionState.ANXIOUS: "表现出紧张、担心，语速可能较快，容易转移话题，用词谨慎",
+    EmotionState.DEPRESSED: "语调低沉，回应较少，可能表达无助感，缺乏动力",
+    EmotionState.CONFUSED: "表现出困惑、不确定，经常说'不知道'、'可能'、'也许'",
+    EmotionState.ANGRY: "语气可能较冲，容易情绪化，可能对建议有抗拒",
+    EmotionState.CALM: "相对平静，能够理性交流，语气平和",
+    EmotionState.HOPEFUL: "积极一些，愿意尝试建议，对未来有期待",
+    EmotionState.RESISTANT: "对咨询师的话有质疑，可能不太配合，表现出防御",
+    EmotionState.TRUSTING: "更愿意分享，语气较为放松，主动提供信息",
+    EmotionState.AVOIDANT: "回避深入话题，可能转移话题，不愿深入",
+    EmotionState.OPEN: "比较愿意交流，会分享更多细节，表达较为直接",
+    EmotionState.OTHER: "根据具体情况灵活表现",
+}
+
+DEFAULT_EMOTION_GUIDE = "保持自然的情绪表达"
+
+# 各级别信息透露所需的最低信任度
+REVEAL_THRESHOLDS = {"surface": 0.1, "moderate": 0.4, "deep": 0.7}
+
+# 保留的情绪变化记录条数
+EMOTION_HISTORY_SIZE = 32
+
+# 性格特征关键词 -> 个性化参数的调整系数，按顺序匹配
+TRAIT_ADJUSTMENTS = (
+    ("内向", (("openness_level", 0.8), ("chattiness", 0.7))),
+    ("外向", (("openness_level", 1.2), ("chattiness", 1.3))),
+    ("敏感", (("resistance_level", 1.3), ("avoidance_tendency", 1.2))),
+    ("完美主义", (("avoidance_tendency", 1.2), ("resistance_level", 1.1))),
+)
+
+
 @agent(name="学生 Bot", method_name="chat")
+@agent(name="学生 Bot", method_name="chat_stream")
 class StudentBot(ChatBot, RiskAssessmentMixin):
     """
     学生Bot
     模拟学生在心理咨询中的真实表现
     """
 
-    def __init__(self):
+    def __init__(
+        self, llm_client: Optional[AsyncOpenAI] = None, cache: Optional[bool] = None
+    ):
         """
         初始化学生Bot
+
+        Args:
+            llm_client: 共享的LLM客户端，为空时创建新的客户端
+            cache: 是否启用回复缓存，为空时使用类上的 cache_responses 默认值
         """
-        super().__init__()
+        super().__init__(llm_client, cache)
         # 情绪状态管理
         self.current_emotion: EmotionState = EmotionState.ANXIOUS
-        self.emotion_history: List[Dict[str, Any]] = []
+        # 只保留最近的情绪变化记录，转换总次数单独计数
+        self.emotion_history: Deque[Dict[str, Any]] = deque(maxlen=EMOTION_HISTORY_SIZE)
+        self.emotion_transition_count = 0
         self.session_notes: List[str] = []  # 记录关键信息
 
         # 行为特征配置
@@ -46,6 +104,8 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
 
         # 学生背景信息（待设置）
         self.student_background: Optional[StudentBackground] = None
+        # 系统提示词中不随对话变化的部分，设置背景时生成
+        self._static_prompt: Optional[str] = None
 
     def update_background(self, student_background: StudentBackground):
         """
@@ -55,6 +115,7 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
             student_background: 学生背景信息
         """
         self.student_background = student_background
+        self._static_prompt = self._build_static_prompt()
         self.current_emotion = self._determine_initial_emotion()
 
         # 根据背景调整个性化参数
@@ -65,20 +126,7 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         if not self.student_background:
             return EmotionState.ANXIOUS
 
-        emotion_mapping = {
-            PsychologicalIssue.ACADEMIC_ANXIETY: EmotionState.ANXIOUS,
-            PsychologicalIssue.SOCIAL_PHOBIA: EmotionState.ANXIOUS,
-            PsychologicalIssue.DEPRESSION: EmotionState.DEPRESSED,
-            PsychologicalIssue.PROCRASTINATION: EmotionState.CONFUSED,
-            PsychologicalIssue.OCD_SYMPTOMS: EmotionState.ANXIOUS,
-            PsychologicalIssue.ADAPTATION_ISSUES: EmotionState.CONFUSED,
-            PsychologicalIssue.RELATIONSHIP_ISSUES: EmotionState.DEPRESSED,
-            PsychologicalIssue.FAMILY_CONFLICTS: EmotionState.ANGRY,
-            PsychologicalIssue.IDENTITY_CONFUSION: EmotionState.CONFUSED,
-            PsychologicalIssue.SLEEP_PROBLEMS: EmotionState.ANXIOUS,
-        }
-
-        return emotion_mapping.get(
+        return ISSUE_INITIAL_EMOTIONS.get(
             self.student_background.current_psychological_issue, EmotionState.ANXIOUS
         )
 
@@ -90,18 +138,12 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         traits = self.student_background.personality_traits
 
         for trait in traits:
-            if "内向" in trait:
-                self.openness_level *= 0.8
-                self.chattiness *= 0.7
-            elif "外向" in trait:
-                self.openness_level *= 1.2
-                self.chattiness *= 1.3
-            elif "敏感" in trait:
-                self.resistance_level *= 1.3
-                self.avoidance_tendency *= 1.2
-            elif "完美主义" in trait:
-                self.avoidance_tendency *= 1.2
-                self.resistance_level *= 1.1
+            # 每个性格特征只按第一个命中的关键词调整
+            for keyword, factors in TRAIT_ADJUSTMENTS:
+                if keyword in trait:
+                    for attr, factor in factors:
+                        setattr(self, attr, getattr(self, attr) * factor)
+                    break
 
     def convert_history_to_messages(
         self, conversation_history: List[ConversationMessage]
@@ -118,7 +160,19 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         if not self.student_background:
             raise ValueError("未配置学生背景信息")
 
-        base_prompt = f"""# Role: 心理咨询来访者（大学生）
+        # 背景部分在设置背景时已生成，每轮只需格式化当前状态部分
+        return self._static_prompt + self._build_dynamic_prompt()
+
+    def split_system_prompt(self) -> Tuple[Optional[str], str]:
+        """拆分系统提示词：背景部分在整个会话内不变，作为静态前缀"""
+        if not self.student_background:
+            raise ValueError("未配置学生背景信息")
+
+        return self._static_prompt, self._build_dynamic_prompt()
+
+    def _build_static_prompt(self) -> str:
+        """构建系统提示词中的静态部分（角色规则与学生背景）"""
+        return f"""# Role: 心理咨询来访者（大学生）
 你是一名正在接受心理咨询的大学生，你需要根据自己的背景和心理问题，真实地表达自己的感受和困扰。
 
 ## Rules
@@ -148,7 +202,7 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
 {self.student_background.family_background}
 
 ## 性格特征
-{", ".join(self.student_background.personality_traits)}
+{self.student_background.personality_traits_joined}
 
 ## 心理侧写
 {self.student_background.psychological_profile}
@@ -160,7 +214,11 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
 {self.student_background.hidden_personal_info}
 
 
-# 当前状态
+"""
+
+    def _build_dynamic_prompt(self) -> str:
+        """构建系统提示词中随对话变化的部分（当前状态与行为指导）"""
+        return f"""# 当前状态
 - 对话轮数：{self.current_round}
 - 情绪状态：{self.current_emotion.value}
 - 信任度：{self.trust_level:.1f}/1.0
@@ -173,24 +231,10 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
 ## 行为调整建议
 {self._get_behavior_guidance()}
 """
-        return base_prompt
 
     def _get_emotion_guidance(self) -> str:
         """获取当前情绪的行为指导"""
-        emotion_guides = {
-            EmotionState.ANXIOUS: "表现出紧张、担心，语速可能较快，容易转移话题，用词谨慎",
-            EmotionState.DEPRESSED: "语调低沉，回应较少，可能表达无助感，缺乏动力",
-            EmotionState.CONFUSED: "表现出困惑、不确定，经常说'不知道'、'可能'、'也许'",
-            EmotionState.ANGRY: "语气可能较冲，容易情绪化，可能对建议有抗拒",
-            EmotionState.CALM: "相对平静，能够理性交流，语气平和",
-            EmotionState.HOPEFUL: "积极一些，愿意尝试建议，对未来有期待",
-            EmotionState.RESISTANT: "对咨询师的话有质疑，可能不太配合，表现出防御",
-            EmotionState.TRUSTING: "更愿意分享，语气较为放松，主动提供信息",
-            EmotionState.AVOIDANT: "回避深入话题，可能转移话题，不愿深入",
-            EmotionState.OPEN: "比较愿意交流，会分享更多细节，表达较为直接",
-            EmotionState.OTHER: "根据具体情况灵活表现",
-        }
-        return emotion_guides.get(self.current_emotion, "保持自然的情绪表达")
+        return EMOTION_GUIDES.get(self.current_emotion, DEFAULT_EMOTION_GUIDE)
 
     def _get_behavior_guidance(self) -> str:
         """获取行为指导建议"""
@@ -226,8 +270,7 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         Returns:
             bool: 是否应该透露
         """
-        thresholds = {"surface": 0.1, "moderate": 0.4, "deep": 0.7}
-        threshold = thresholds.get(information_level, 0.5)
+        threshold = REVEAL_THRESHOLDS.get(information_level, 0.5)
 
         return (
             self.trust_level >= threshold
@@ -238,6 +281,7 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         """转换到新状态"""
         current_emotion = self.current_emotion
         self.update_state(new_emotion, reason)
+        self.emotion_transition_count += 1
 
         # 记录状态转换
         note = (
@@ -270,8 +314,8 @@ class StudentBot(ChatBot, RiskAssessmentMixin):
         """获取情绪变化总结"""
         return {
             "current_emotion": self.current_emotion.value,
-            "emotion_transitions": len(self.emotion_history),
-            "emotion_history": self.emotion_history[-5:],  # 最近5次情绪变化
+            "emotion_transitions": self.emotion_transition_count,
+            "emotion_history": list(self.emotion_history)[-5:],  # 最近5次情绪变化
             "trust_evolution": self.trust_level,
             "openness_evolution": self.openness_level,
         }
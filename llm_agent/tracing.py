@@ -0,0 +1,56 @@
+"""
+链路追踪装饰器
+统一提供 agent / workflow / task 装饰器和当前 span 的访问；未安装 traceloop
+或设置了 TRACELOOP_DISABLED 时退化为不做任何处理的实现，不导入 traceloop/OpenTelemetry
+"""
+
+from settings import settings
+
+
+def _noop_decorator(*args, **kwargs):
+    """不做任何处理的装饰器，与 traceloop 装饰器签名兼容"""
+    return lambda obj: obj
+
+
+TRACING_ENABLED = False
+
+if not settings.TRACELOOP_DISABLED:
+    try:
+        from traceloop.sdk.decorators import agent, task, workflow
+
+        TRACING_ENABLED = True
+    except ImportError:
+        pass
+
+if not TRACING_ENABLED:
+    agent = task = workflow = _noop_decorator
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span，与 OpenTelemetry span 的 add_event 签名兼容"""
+
+    def add_event(self, name, attributes=None, timestamp=None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_span():
+    """获取当前 span，追踪关闭时返回不做任何处理的空 span"""
+    if not TRACING_ENABLED:
+        return _NOOP_SPAN
+
+    from opentelemetry import trace
+
+    return trace.get_current_span()
+
+
+def init_tracing():
+    """初始化 Traceloop，追踪关闭时不做任何处理"""
+    if not TRACING_ENABLED:
+        return
+
+    from traceloop.sdk import Traceloop
+
+    Traceloop.init(api_key=settings.TRACELOOP_API_KEY, disable_batch=True)
@@ -3,8 +3,9 @@
 使用 Pydantic BaseModel 定义所有数据结构
 """
 
+from functools import cached_property
 from typing import List, Dict, Optional, Any, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
 
 
@@ -80,6 +81,9 @@ class StudentBasicInfo(BaseModel):
 class StudentBackground(BaseModel):
     """学生背景信息模型"""
 
+    # 背景生成后只读，拼接结果与各Agent缓存的格式化文本不会过期
+    model_config = ConfigDict(frozen=True)
+
     age: int = Field(..., description="年龄")
     gender: str = Field(..., description="性别")
     grade: str = Field(..., description="年级")
@@ -93,6 +97,11 @@ class StudentBackground(BaseModel):
     )
     symptom_description: str = Field(..., description="症状描述")
 
+    @cached_property
+    def personality_traits_joined(self) -> str:
+        """以逗号分隔的性格特征文本，每个实例只拼接一次"""
+        return ", ".join(self.personality_traits)
+
     def to_basic_info(self) -> StudentBasicInfo:
         """转换为学生基本信息模型"""
         return StudentBasicInfo(
@@ -103,14 +112,25 @@ class StudentBackground(BaseModel):
 class CounselorBackground(BaseModel):
     """咨询师背景信息模型"""
 
+    # 背景生成后只读，拼接结果与各Agent缓存的格式化文本不会过期
+    model_config = ConfigDict(frozen=True)
+
     therapy_approach: TherapyApproach = Field(..., description="咨询流派")
     communication_style: str = Field(..., description="沟通习惯和风格")
     specialization: List[str] = Field(..., description="专业领域")
 
+    @cached_property
+    def specialization_joined(self) -> str:
+        """以逗号分隔的专业领域文本，每个实例只拼接一次"""
+        return ", ".join(self.specialization)
+
 
 class BackgroundInfo(BaseModel):
     """背景信息汇总模型"""
 
+    # 背景生成后只读，各Agent可以按对象缓存格式化文本
+    model_config = ConfigDict(frozen=True)
+
     student_info: StudentBackground
     counselor_info: CounselorBackground
     initial_question: str = Field(..., description="学生首次咨询的问题")
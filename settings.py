@@ -65,12 +65,19 @@ class SystemConfig(BaseSettings):
     # ==================== LLM 配置 ====================
     DEFAULT_TEMPERATURE: float = 0.8  # 默认创造性温度
     DEFAULT_MAX_TOKENS: int = 16384  # 默认最大token数
+    LLM_BATCH_CONCURRENCY: int = 16  # 批量模式下的最大并发会话数
+    # 为 system 提示词的静态部分标注 cache_control（Anthropic/Bedrock 等需显式标注的服务商）
+    LLM_PROMPT_CACHE_CONTROL: bool = False
+    # 将 system 提示词中随对话变化的部分放到对话历史之后，使“静态前缀 + 对话历史”跨轮次保持不变
+    LLM_STABLE_PROMPT_PREFIX: bool = False
 
     # ==================== 输出配置 ====================
     OUTPUT_DIR: str = "output"
     CONVERSATIONS_DIR: str = os.path.join(OUTPUT_DIR, "conversations")
     BACKGROUNDS_DIR: str = os.path.join(OUTPUT_DIR, "backgrounds")
     ASSESSMENTS_DIR: str = os.path.join(OUTPUT_DIR, "assessments")
+    LLM_CACHE_DIR: str = os.path.join(OUTPUT_DIR, "cache")  # LLM响应缓存目录
+    LLM_CACHE_MEMORY_SIZE: int = 256  # 每个命名空间在内存中保留的缓存条数
 
     # ==================== StreamLit 界面配置 ====================
     PAGE_TITLE: str = "心理咨询对话数据生成系统"
@@ -89,6 +96,7 @@ class SystemConfig(BaseSettings):
 
     # ==================== 监控和日志配置 ====================
     TRACELOOP_API_KEY: str = ""  # Traceloop API Key
+    TRACELOOP_DISABLED: bool = False  # 关闭链路追踪（批量评估时可减少启动开销）
 
     def ensure_output_dirs(self):
         """确保输出目录存在"""
@@ -97,6 +105,7 @@ class SystemConfig(BaseSettings):
             self.CONVERSATIONS_DIR,
             self.BACKGROUNDS_DIR,
             self.ASSESSMENTS_DIR,
+            self.LLM_CACHE_DIR,
         ]
         for dir_path in dirs:
             os.makedirs(dir_path, exist_ok=True)